@@ -5,11 +5,10 @@ import logging
 from datetime import datetime
 from typing import Dict, Any, Optional
 
-from fastapi import FastAPI, Request, HTTPException, Header
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, HTTPException, Header, Depends
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel
-from supabase import create_client, Client
-from supabase.lib.client_options import ClientOptions
+from supabase import Client
 from dotenv import load_dotenv
 
 # Import our new services and models
@@ -17,6 +16,7 @@ from models.message import WebhookPayload, MessageResponse
 from services.auth_user_service import AuthUserService
 from services.message_processor import MessageProcessor
 from services.bluebubbles_client import get_bluebubbles_client
+from utils.dependencies import get_supabase_client
 
 # Load environment variables
 load_dotenv()
@@ -29,25 +29,14 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="BlueBubbles Webhook Receiver",
     description="FastAPI webhook receiver for BlueBubbles events",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# Store Supabase credentials for per-request client creation
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-if not supabase_url or not supabase_service_role_key:
+# Fail fast at startup; the shared client itself is built lazily by get_supabase_client
+if not os.getenv("SUPABASE_URL") or not os.getenv("SUPABASE_SERVICE_ROLE_KEY"):
     raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in environment variables")
 
-def get_fresh_supabase_client() -> Client:
-    """Create a completely fresh Supabase client for each request to prevent session conflicts"""
-    # Use ClientOptions to ensure complete isolation
-    options = ClientOptions(
-        auto_refresh_token=False,  # Disable automatic token refresh
-        persist_session=False      # Don't persist session state
-    )
-    return create_client(supabase_url, supabase_service_role_key, options)
-
 # Initialize BlueBubbles client (stateless)
 bluebubbles_client = get_bluebubbles_client()
 
@@ -82,6 +71,12 @@ def validate_shared_secret(x_shared_secret: Optional[str]) -> bool:
 
 
 
+@app.on_event("shutdown")
+async def close_bluebubbles_client():
+    """Close the pooled BlueBubbles HTTP client on shutdown."""
+    await bluebubbles_client.close()
+
+
 @app.get("/healthz", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint."""
@@ -95,7 +90,8 @@ async def health_check():
 @app.post("/webhooks/bluebubbles", response_model=MessageResponse)
 async def receive_bluebubbles_webhook(
     request: Request,
-    x_shared_secret: Optional[str] = Header(None, alias="X-Shared-Secret")
+    x_shared_secret: Optional[str] = Header(None, alias="X-Shared-Secret"),
+    supabase_client: Client = Depends(get_supabase_client)
 ):
     """
     Receive and process BlueBubbles webhook events.
@@ -137,15 +133,13 @@ async def receive_bluebubbles_webhook(
     # Log the incoming webhook
     logger.info(f"Received BlueBubbles webhook - Event ID: {event_id}, Type: {event_type}")
     
-    # Process the message with completely fresh Supabase client per webhook
+    # Process the message with the shared service-role Supabase client; OTP
+    # sign-in and verification run on their own throwaway auth clients
     try:
-        # Create completely isolated services for each webhook request
-        logger.info(f"Creating fresh Supabase client for webhook {event_id}")
-        fresh_supabase_client = get_fresh_supabase_client()
-        auth_user_service = AuthUserService(fresh_supabase_client)
+        auth_user_service = AuthUserService(supabase_client)
         message_processor = MessageProcessor(auth_user_service, bluebubbles_client)
         
-        logger.info(f"Processing webhook {event_id} with isolated client")
+        logger.info(f"Processing webhook {event_id}")
         result = await message_processor.process_webhook_message(webhook_payload)
         
         logger.info(f"Processed webhook {event_id}: {result.message}")
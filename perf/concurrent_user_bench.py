@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent user creation through AuthUserService or the webhook endpoint
+Reports success counts and p50/p95/p99 latency so concurrency can be scaled past
+the fixed five users the individual test scripts use
+"""
+
+import argparse
+import asyncio
+import os
+import secrets
+import statistics
+import sys
+import time
+
+# Add the project root to Python path
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+import aiohttp
+from dotenv import load_dotenv
+from services.auth_user_service import AuthUserService
+from utils.dependencies import create_pooled_client
+from utils.script_helpers import (
+    CONCURRENCY_LIMIT, JSON_HEADERS, create_realistic_payload, dump_json, in_thread, load_json, run,
+    size_thread_pool
+)
+
+WEBHOOK_URL = "http://localhost:8000/webhooks/bluebubbles"
+
+# Attempts at finding a block of 555 numbers no earlier run left behind
+_MAX_PHONE_ATTEMPTS = 5
+
+def make_test_users(n: int, base: int):
+    """Build n (email, phone, guid) triples on consecutive 555 numbers from base"""
+    run_id = time.time_ns()
+    return [
+        (f"bench-{i}-{run_id}@example.com", f"+1555{(base + i) % 10_000_000:07d}", f"bench-{i}-{run_id}")
+        for i in range(n)
+    ]
+
+async def pick_test_users(auth_service: AuthUserService, n: int):
+    """Pick a random block of n phones that has no profiles yet, so --keep runs never collide"""
+    for _ in range(_MAX_PHONE_ATTEMPTS):
+        test_users = make_test_users(n, secrets.randbelow(10_000_000))
+        existing, errors = await auth_service.get_users_by_phone_numbers([phone for _, phone, _ in test_users])
+        if not existing and not errors:
+            return test_users
+    raise RuntimeError(f"No free block of {n} test phone numbers after {_MAX_PHONE_ATTEMPTS} attempts")
+
+async def _timed(sem: asyncio.Semaphore, coro):
+    """Run coro under the semaphore and return (succeeded, latency in ns)"""
+    async with sem:
+        start = time.perf_counter_ns()
+        try:
+            ok = bool(await coro)
+        except Exception:
+            ok = False
+        return ok, time.perf_counter_ns() - start
+
+async def _create_via_webhook(session, email: str, phone: str, guid: str):
+    async with session.post(WEBHOOK_URL, data=dump_json(create_realistic_payload(phone, email, guid))) as response:
+        # The webhook answers 200 with success=false when processing fails
+        result = load_json(await response.read())
+        return response.status == 200 and bool(result.get("success"))
+
+def report(mode: str, results, wall_ns: int):
+    """Print success count, throughput and latency percentiles for one run"""
+    latencies_ms = sorted(ns / 1_000_000 for _, ns in results)
+    successes = sum(ok for ok, _ in results)
+    wall_s = wall_ns / 1_000_000_000
+
+    print(f"=== {mode} benchmark ===")
+    print(f"Users: {len(results)}  Succeeded: {successes}  Failed: {len(results) - successes}")
+    print(f"Wall time: {wall_s:.3f}s  Throughput: {len(results) / wall_s:.1f} users/s")
+    if len(latencies_ms) >= 2:
+        # quantiles(n=100) yields the 1st..99th percentile cut points
+        cuts = statistics.quantiles(latencies_ms, n=100)
+        print(f"Latency p50: {cuts[49]:.1f}ms  p95: {cuts[94]:.1f}ms  p99: {cuts[98]:.1f}ms")
+    elif latencies_ms:
+        print(f"Latency: {latencies_ms[0]:.1f}ms")
+
+async def bench(n: int, concurrency: int, mode: str = "service", keep: bool = False):
+    """Create n users with at most `concurrency` in flight and report latency"""
+    load_dotenv()
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        print("❌ Missing Supabase credentials")
+        return []
+
+    # One shared service-role client for every task and for the verification step
+    client = create_pooled_client(url, key)
+    auth_service = AuthUserService(client)
+    test_users = await pick_test_users(auth_service, n)
+    sem = asyncio.Semaphore(concurrency)
+
+    start = time.perf_counter_ns()
+    if mode == "webhook":
+        connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, keepalive_timeout=30)
+        async with aiohttp.ClientSession(connector=connector, headers=JSON_HEADERS) as session:
+            results = await asyncio.gather(*(
+                _timed(sem, _create_via_webhook(session, email, phone, guid))
+                for email, phone, guid in test_users
+            ))
+    else:
+        # The supabase client is blocking, so each creation needs its own worker thread
+        size_thread_pool(concurrency)
+        results = await asyncio.gather(*(
+            _timed(sem, in_thread(auth_service.create_authenticated_user(
+                bluebubbles_guid=guid,
+                phone_number=phone,
+                email=email,
+                chat_identifier=phone
+            )))
+            for email, phone, guid in test_users
+        ))
+    wall_ns = time.perf_counter_ns() - start
+
+    report(mode, results, wall_ns)
+
+    # Post-run sanity check against the database with the same phone list
+    users_by_phone, lookup_errors = await auth_service.get_users_by_phone_numbers([phone for _, phone, _ in test_users])
+    print(f"Profiles found in database: {len(users_by_phone)}/{n}")
+    for phone, error in lookup_errors.items():
+        print(f"⚠️  Lookup failed for {phone}: {error}")
+
+    if not keep:
+        for user in users_by_phone.values():
+            try:
+                await asyncio.to_thread(auth_service.admin_auth.delete_user, user.auth_user.id)
+            except Exception as e:
+                print(f"⚠️  Cleanup failed for {user.profile.phone_number}: {e}")
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--users", type=int, default=5, help="number of users to create")
+    parser.add_argument("-c", "--concurrency", type=int, default=CONCURRENCY_LIMIT)
+    parser.add_argument("--mode", choices=("service", "webhook"), default="service")
+    parser.add_argument("--keep", action="store_true", help="don't delete the created users")
+    args = parser.parse_args()
+
+    run(bench(args.users, args.concurrency, args.mode, args.keep))
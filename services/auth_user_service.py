@@ -1,17 +1,24 @@
 import logging
-from typing import Optional, Dict, Any
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
+from gotrue import SyncMemoryStorage
 from supabase import Client
+from supabase.lib.auth_client import SupabaseAuthClient
 from supabase.lib.client_options import ClientOptions
 from models.auth_user import AuthUser, UserProfileCreate, UserProfileUpdate
 from models.user import UserProfile
 
+@dataclass(slots=True)
 class AuthUserWithProfile:
-    """Combined auth user with profile data"""
-    def __init__(self, auth_user, profile):
-        self.auth_user = auth_user
-        self.user = auth_user  # For backward compatibility
-        self.profile = profile
+    """Combined auth user with profile data; both parts are always present"""
+    auth_user: Any
+    profile: UserProfile
+    
+    @property
+    def user(self):
+        """Alias of auth_user for backward compatibility"""
+        return self.auth_user
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +31,24 @@ class AuthUserService:
         # Access the admin auth API for server-side operations
         self.admin_auth = supabase_client.auth.admin
     
+    def isolated_auth_client(self) -> SupabaseAuthClient:
+        """
+        Throwaway auth client for end-user flows such as OTP sign-in and verification.
+        
+        verify_otp stores the user's session on the client that made the call, and the
+        Supabase client then rebuilds PostgREST with that user's JWT. Running those calls
+        here keeps the shared service-role client on the service key. Use it as a context
+        manager so its HTTP connections are closed.
+        """
+        key = self.supabase.supabase_key
+        return SupabaseAuthClient(
+            url=self.supabase.auth_url,
+            headers={"apiKey": key, "Authorization": f"Bearer {key}"},
+            auto_refresh_token=False,
+            persist_session=False,
+            storage=SyncMemoryStorage()
+        )
+    
     async def get_or_create_user_by_guid(
         self, 
         bluebubbles_guid: str, 
@@ -84,13 +109,15 @@ class AuthUserService:
             if not email:
                 raise Exception("Email is required for user creation")
             
-            # Check for existing user by phone or email first (prevents race conditions)
-            existing_by_phone = await self.get_user_by_phone_number(phone_number)
+            # Check for existing user by phone or email first (prevents race conditions).
+            # Lookup errors propagate: treating a failed lookup as "no user" would send a
+            # known email down the create path and overwrite the existing profile
+            existing_by_phone = await self._find_user_by_profile_column("phone_number", phone_number)
             if existing_by_phone:
                 logger.info(f"User already exists with phone {phone_number}")
                 return existing_by_phone
             
-            existing_by_email = await self.get_user_by_email(email)
+            existing_by_email = await self._find_user_by_profile_column("email", email)
             if existing_by_email:
                 logger.info(f"User already exists with email {email}")
                 return existing_by_email
@@ -146,43 +173,25 @@ class AuthUserService:
             # Handle profile creation with database trigger compatibility
             profile_result = None
             try:
-                # First check if profile already exists (created by database trigger)
-                existing_profile = self.supabase.table("user_profiles").select("*").eq("id", auth_user_data.id).execute()
+                # Single atomic upsert on the primary key: whether the on_auth_user_created
+                # trigger or this request writes first, the second write merges our data
+                profile_result = self.supabase.table("user_profiles").upsert({
+                    "id": auth_user_data.id,
+                    "bluebubbles_guid": bluebubbles_guid,
+                    "phone_number": phone_number,
+                    "email": email,
+                    "chat_identifier": chat_identifier,
+                    "interaction_count": 1,
+                    "onboarding_completed": False,
+                    "onboarding_state": "not_started",
+                    "email_verified": False
+                }, on_conflict="id").execute()
                 
-                if existing_profile.data:
-                    # Profile exists (created by trigger), update it with our data
-                    logger.info(f"Profile exists from trigger, updating with BlueBubbles data for {auth_user_data.id}")
-                    
-                    profile_result = self.supabase.table("user_profiles").update({
-                        "bluebubbles_guid": bluebubbles_guid,
-                        "phone_number": phone_number,
-                        "email": email,
-                        "chat_identifier": chat_identifier,
-                        "interaction_count": 1,
-                        "onboarding_completed": False,
-                        "onboarding_state": "not_started",
-                        "email_verified": False
-                    }).eq("id", auth_user_data.id).execute()
-                    
-                    logger.info(f"Updated existing profile for user {auth_user_data.id}")
-                else:
-                    # No profile exists, create new one
-                    profile_result = self.supabase.table("user_profiles").insert({
-                        "id": auth_user_data.id,
-                        "bluebubbles_guid": bluebubbles_guid,
-                        "phone_number": phone_number,
-                        "email": email,
-                        "chat_identifier": chat_identifier,
-                        "interaction_count": 1,
-                        "onboarding_completed": False,
-                        "onboarding_state": "not_started",
-                        "email_verified": False
-                    }).execute()
-                    
-                    logger.info(f"Created new profile for user {auth_user_data.id}")
+                logger.info(f"Upserted profile for user {auth_user_data.id}")
                     
             except Exception as profile_error:
-                # Handle any remaining conflicts gracefully
+                # Remaining conflicts come from the phone/email/GUID unique constraints,
+                # i.e. another request created this user concurrently
                 error_msg = str(profile_error).lower()
                 if any(conflict in error_msg for conflict in ["already exists", "duplicate", "unique constraint"]):
                     # Another request created this user concurrently, fetch existing
@@ -326,58 +335,74 @@ class AuthUserService:
             logger.error(f"Error getting user profile by GUID {bluebubbles_guid}: {str(e)}")
             return None
     
+    async def _find_user_by_profile_column(self, column: str, value: str) -> Optional[AuthUserWithProfile]:
+        """Get authenticated user with profile by a unique user_profiles column; errors are raised"""
+        profile_result = self.supabase.table("user_profiles").select("*").eq(column, value).execute()
+        
+        if not profile_result.data:
+            return None
+        
+        profile_data = profile_result.data[0]
+        user_profile = UserProfile(**profile_data)
+        
+        # Get auth user data
+        auth_user_result = self.admin_auth.get_user_by_id(profile_data["id"])
+        if not auth_user_result.user:
+            return None
+        
+        return AuthUserWithProfile(
+            auth_user=auth_user_result.user,
+            profile=user_profile
+        )
+
     async def get_user_by_phone_number(self, phone_number: str) -> Optional[AuthUserWithProfile]:
         """Get authenticated user with profile by phone number"""
         try:
-            # Get user profile by phone number
-            profile_result = self.supabase.table("user_profiles").select("*").eq(
-                "phone_number", phone_number
-            ).execute()
-            
-            if not profile_result.data:
-                return None
-            
-            profile_data = profile_result.data[0]
-            user_profile = UserProfile(**profile_data)
-            
-            # Get auth user data
-            auth_user_result = self.admin_auth.get_user_by_id(profile_data["id"])
-            if not auth_user_result.user:
-                return None
-            
-            return AuthUserWithProfile(
-                auth_user=auth_user_result.user,
-                profile=user_profile
-            )
-            
+            return await self._find_user_by_profile_column("phone_number", phone_number)
         except Exception as e:
             logger.error(f"Error getting user by phone number {phone_number}: {str(e)}")
             return None
 
+    async def get_users_by_phone_numbers(
+        self,
+        phone_numbers: List[str]
+    ) -> Tuple[Dict[str, AuthUserWithProfile], Dict[str, Exception]]:
+        """
+        Get authenticated users with profiles for many phone numbers in one query.
+        
+        Returns (users, errors), both keyed by phone number; a phone in neither
+        has no profile. A failed lookup only affects its own phone number.
+        """
+        try:
+            # One IN query for every profile instead of one query per phone number
+            profile_result = self.supabase.table("user_profiles").select("*").in_(
+                "phone_number", phone_numbers
+            ).execute()
+        except Exception as e:
+            logger.error(f"Error getting profiles for phone numbers {phone_numbers}: {str(e)}")
+            return {}, {phone: e for phone in phone_numbers}
+        
+        users = {}
+        errors = {}
+        for profile_data in profile_result.data or []:
+            phone = profile_data["phone_number"]
+            try:
+                auth_user = self.admin_auth.get_user_by_id(profile_data["id"]).user
+                if auth_user:
+                    users[phone] = AuthUserWithProfile(
+                        auth_user=auth_user,
+                        profile=UserProfile(**profile_data)
+                    )
+            except Exception as e:
+                logger.error(f"Error getting user by phone number {phone}: {str(e)}")
+                errors[phone] = e
+        
+        return users, errors
+
     async def get_user_by_email(self, email: str) -> Optional[AuthUserWithProfile]:
         """Get authenticated user with profile by email address"""
         try:
-            # Get user profile by email
-            profile_result = self.supabase.table("user_profiles").select("*").eq(
-                "email", email
-            ).execute()
-            
-            if not profile_result.data:
-                return None
-            
-            profile_data = profile_result.data[0]
-            user_profile = UserProfile(**profile_data)
-            
-            # Get auth user data
-            auth_user_result = self.admin_auth.get_user_by_id(profile_data["id"])
-            if not auth_user_result.user:
-                return None
-            
-            return AuthUserWithProfile(
-                auth_user=auth_user_result.user,
-                profile=user_profile
-            )
-            
+            return await self._find_user_by_profile_column("email", email)
         except Exception as e:
             logger.error(f"Error getting user by email {email}: {str(e)}")
             return None
@@ -14,7 +14,16 @@ class BlueBubblesClient:
     def __init__(self, server_url: str, server_password: str):
         self.server_url = server_url.rstrip('/')
         self.server_password = server_password
-        self.client = httpx.AsyncClient(timeout=30.0)
+        # One pooled client for the app's lifetime; a longer keep-alive expiry lets
+        # bursts of webhook replies reuse connections instead of reconnecting
+        self.client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=30.0
+            )
+        )
     
     def _generate_temp_guid(self) -> str:
         """Generate a unique temporary GUID for message requests"""
@@ -18,6 +18,12 @@ class MessageProcessor:
         self.bluebubbles_client = bluebubbles_client
         self.onboarding_service = OnboardingService(auth_user_service)
         self.ai_conversation_service = AIConversationService(auth_user_service.supabase)
+        # Onboarding state -> handler for existing users who haven't finished verification
+        self._existing_user_state_handlers = {
+            "not_started": self._handle_not_started_existing,
+            "awaiting_email": self._handle_awaiting_email_existing,
+            "awaiting_email_otp": self._handle_awaiting_email_otp_existing,
+        }
     
     async def process_webhook_message(self, payload: WebhookPayload) -> MessageResponse:
         """
@@ -231,62 +237,69 @@ class MessageProcessor:
                     else:
                         return "❌ Sorry, I couldn't send the verification email. Please try again later."
             
-            # Check current onboarding state for users without email
-            if existing_user.profile.onboarding_state == "not_started":
-                # User exists but hasn't started onboarding - check if they provided email in this message
-                extracted_email = self._extract_email_from_text(message_text)
-                logger.info(f"DEBUG: not_started state - Text: '{message_text}', Extracted email: '{extracted_email}'")
-                if extracted_email:
-                    # User provided email in their message - process it directly
-                    logger.info(f"DEBUG: Processing extracted email {extracted_email} for existing user")
-                    return await self._handle_email_provided_existing(existing_user, extracted_email)
-                else:
-                    # No email found - prompt for email
-                    logger.info(f"DEBUG: No email found, updating state to awaiting_email")
-                    await self._update_onboarding_state(existing_user.profile.id, "awaiting_email")
-                    return (
-                        "👋 Welcome back! To get started, I need to verify your email address.\n\n"
-                        "Please reply with your email address.\n\n"
-                        "💡 Type 'restart' at any time to restart the verification process."
-                    )
-            elif existing_user.profile.onboarding_state == "awaiting_email":
-                # User should provide email - try to extract email from natural language
-                extracted_email = self._extract_email_from_text(message_text)
-                if extracted_email:
-                    return await self._handle_email_provided_existing(existing_user, extracted_email)
-                else:
-                    return (
-                        "❌ I couldn't find a valid email address in your message.\n\n"
-                        "Please provide your email address (e.g., your.email@example.com)\n\n"
-                        "💡 Type 'restart' to start over."
-                    )
-            elif existing_user.profile.onboarding_state == "awaiting_email_otp":
-                # User should provide OTP code, but also check if they provided a new email
-                otp_code = self._extract_otp_from_text(message_text)
-                extracted_email = self._extract_email_from_text(message_text)
-                
-                logger.info(f"Email extraction debug - Text: '{message_text}', Extracted email: '{extracted_email}', OTP: '{otp_code}'")
-                
-                if otp_code:
-                    return await self._handle_otp_verification_existing(existing_user, otp_code)
-                elif extracted_email:
-                    # User provided a new email - update and send new OTP
-                    logger.info(f"Processing email {extracted_email} for existing user")
-                    return await self._handle_email_provided_existing(existing_user, extracted_email)
-                else:
-                    return (
-                        "Please enter the 6-digit verification code from your email.\n\n"
-                        "Example: 123456\n\n"
-                        "💡 Type 'restart' to restart the verification process with a new email."
-                    )
-            else:
-                # Unknown state - restart onboarding
+            # Dispatch on the current onboarding state; unknown states restart onboarding
+            handler = self._existing_user_state_handlers.get(existing_user.profile.onboarding_state)
+            if handler is None:
                 return await self._restart_verification_process(existing_user)
+            return await handler(existing_user, message_text)
                 
         except Exception as e:
             logger.error(f"Error in existing user workflow: {str(e)}")
             return "❌ Sorry, there was an error processing your message. Please try again or type 'restart' to start over."
 
+    async def _handle_not_started_existing(self, existing_user, message_text: str) -> str:
+        """Handle an existing user who hasn't started onboarding"""
+        # User exists but hasn't started onboarding - check if they provided email in this message
+        extracted_email = self._extract_email_from_text(message_text)
+        logger.info(f"DEBUG: not_started state - Text: '{message_text}', Extracted email: '{extracted_email}'")
+        if extracted_email:
+            # User provided email in their message - process it directly
+            logger.info(f"DEBUG: Processing extracted email {extracted_email} for existing user")
+            return await self._handle_email_provided_existing(existing_user, extracted_email)
+        else:
+            # No email found - prompt for email
+            logger.info(f"DEBUG: No email found, updating state to awaiting_email")
+            await self._update_onboarding_state(existing_user.profile.id, "awaiting_email")
+            return (
+                "👋 Welcome back! To get started, I need to verify your email address.\n\n"
+                "Please reply with your email address.\n\n"
+                "💡 Type 'restart' at any time to restart the verification process."
+            )
+
+    async def _handle_awaiting_email_existing(self, existing_user, message_text: str) -> str:
+        """Handle an existing user who should be providing their email"""
+        # User should provide email - try to extract email from natural language
+        extracted_email = self._extract_email_from_text(message_text)
+        if extracted_email:
+            return await self._handle_email_provided_existing(existing_user, extracted_email)
+        else:
+            return (
+                "❌ I couldn't find a valid email address in your message.\n\n"
+                "Please provide your email address (e.g., your.email@example.com)\n\n"
+                "💡 Type 'restart' to start over."
+            )
+
+    async def _handle_awaiting_email_otp_existing(self, existing_user, message_text: str) -> str:
+        """Handle an existing user who should be providing their OTP code"""
+        # User should provide OTP code, but also check if they provided a new email
+        otp_code = self._extract_otp_from_text(message_text)
+        extracted_email = self._extract_email_from_text(message_text)
+        
+        logger.info(f"Email extraction debug - Text: '{message_text}', Extracted email: '{extracted_email}', OTP: '{otp_code}'")
+        
+        if otp_code:
+            return await self._handle_otp_verification_existing(existing_user, otp_code)
+        elif extracted_email:
+            # User provided a new email - update and send new OTP
+            logger.info(f"Processing email {extracted_email} for existing user")
+            return await self._handle_email_provided_existing(existing_user, extracted_email)
+        else:
+            return (
+                "Please enter the 6-digit verification code from your email.\n\n"
+                "Example: 123456\n\n"
+                "💡 Type 'restart' to restart the verification process with a new email."
+            )
+
     def _extract_email_from_text(self, text: str) -> Optional[str]:
         """Extract email address from natural language text using RegEx"""
         import re
@@ -570,9 +583,10 @@ class MessageProcessor:
             logger.info(f"Sending OTP to email: {email}")
             
             # Use Supabase Auth client API to send OTP
-            response = self.auth_user_service.supabase.auth.sign_in_with_otp({
-                "email": email
-            })
+            with self.auth_user_service.isolated_auth_client() as auth_client:
+                response = auth_client.sign_in_with_otp({
+                    "email": email
+                })
             
             logger.info(f"OTP send response: {response}")
             
@@ -595,11 +609,12 @@ class MessageProcessor:
             logger.info(f"Attempting to verify OTP for email: {email}, code: {otp_code}")
             
             # Use Supabase Auth client API to verify OTP
-            response = self.auth_user_service.supabase.auth.verify_otp({
-                "email": email,
-                "token": otp_code,
-                "type": "email"
-            })
+            with self.auth_user_service.isolated_auth_client() as auth_client:
+                response = auth_client.verify_otp({
+                    "email": email,
+                    "token": otp_code,
+                    "type": "email"
+                })
             
             logger.info(f"OTP verification response: {response}")
             
@@ -259,9 +259,10 @@ class OnboardingService:
         """
         try:
             # Use Supabase Auth API to send email OTP
-            response = self.auth_user_service.supabase.auth.sign_in_with_otp({
-                "email": email
-            })
+            with self.auth_user_service.isolated_auth_client() as auth_client:
+                response = auth_client.sign_in_with_otp({
+                    "email": email
+                })
             
             return {
                 "success": True,
@@ -288,11 +289,12 @@ class OnboardingService:
         """
         try:
             # Use Supabase Auth API to verify OTP
-            response = self.auth_user_service.supabase.auth.verify_otp({
-                "email": email,
-                "token": otp_code,
-                "type": "email"
-            })
+            with self.auth_user_service.isolated_auth_client() as auth_client:
+                response = auth_client.verify_otp({
+                    "email": email,
+                    "token": otp_code,
+                    "type": "email"
+                })
             
             if response.user:
                 return {
@@ -4,19 +4,31 @@ Simple test to verify AI integration works with the merged code
 """
 
 import asyncio
+import functools
 import os
 import sys
 from dotenv import load_dotenv
 
 # Add the project root to Python path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
 
 from services.ai_conversation_service import AIConversationService
 from supabase import create_client
 
-# Load environment variables
+# Load environment variables once at import; the module body only runs once per process
 load_dotenv()
 
+_SUPABASE_URL = os.getenv("SUPABASE_URL")
+_SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+_ANTHROPIC_KEY = os.getenv("ANTHROPIC_API_KEY")
+
+@functools.lru_cache(maxsize=1)
+def get_supabase_client():
+    """Create the Supabase client once and reuse it across tests"""
+    return create_client(_SUPABASE_URL, _SUPABASE_KEY)
+
 async def test_ai_service():
     """Test that AI service can be instantiated and basic functionality works"""
     print("🤖 Testing AI Integration")
@@ -24,18 +36,14 @@ async def test_ai_service():
     
     try:
         # Create Supabase client
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        if not url or not key:
+        if not _SUPABASE_URL or not _SUPABASE_KEY:
             print("❌ Missing Supabase credentials")
             return False
             
-        supabase_client = create_client(url, key)
+        supabase_client = get_supabase_client()
         
         # Check if ANTHROPIC_API_KEY is available
-        anthropic_key = os.getenv("ANTHROPIC_API_KEY")
-        if not anthropic_key:
+        if not _ANTHROPIC_KEY:
             print("⚠️  ANTHROPIC_API_KEY not set - testing basic functionality only")
             # Test basic functionality without AI service initialization
             print("✅ Supabase client created successfully")
@@ -6,12 +6,24 @@ This tests the retry logic fix for user lookup failures
 
 import asyncio
 import aiohttp
-import json
-from datetime import datetime
+import sys
+import time
+
+from utils.script_helpers import CONCURRENCY_LIMIT, JSON_HEADERS, dump_json, run_bounded, run
+
+# Use the actual phone number from the logs that had issues
+_TEST_PHONE = "+19197109288"
+
+# Simulate two users trying to verify at the same time
+# (In reality, these would be different users, but we're testing the lookup logic)
+_TEST_SCENARIOS = (
+    (_TEST_PHONE, "123456", "user1"),
+    (_TEST_PHONE, "654321", "user2"),
+)
 
 def create_otp_payload(phone: str, otp_code: str, guid_suffix: str):
     """Create a realistic OTP verification payload"""
-    timestamp = int(datetime.now().timestamp() * 1000)
+    timestamp = time.time_ns() // 1_000_000
     
     return {
         "type": "new-message",
@@ -41,23 +53,26 @@ async def send_otp_verification(session, phone: str, otp_code: str, user_id: str
     try:
         async with session.post(
             "http://localhost:8000/webhooks/bluebubbles",
-            json=payload,
-            headers={"Content-Type": "application/json"}
+            data=dump_json(payload)
         ) as response:
             result = await response.json()
             status = response.status
-            
-            print(f"📱 {phone}: OTP {otp_code}")
-            print(f"🤖 Response: {result.get('message', 'No response')[:100]}...")
-            print(f"Status: {status}")
+            msg = result.get('message', '')
+            msg_lower = msg.lower()
             
             # Check if verification was successful
-            success = "verified successfully" in result.get('message', '').lower()
-            account_not_found = "couldn't find your account" in result.get('message', '').lower()
+            success = "verified successfully" in msg_lower
+            account_not_found = "couldn't find your account" in msg_lower
             
-            print(f"✅ Verified: {success}")
-            print(f"❌ Account Not Found: {account_not_found}")
-            print()
+            # Emit the whole report in one write so concurrent tasks don't interleave
+            sys.stdout.write(
+                f"📱 {phone}: OTP {otp_code}\n"
+                f"🤖 Response: {(msg or 'No response')[:100]}...\n"
+                f"Status: {status}\n"
+                f"✅ Verified: {success}\n"
+                f"❌ Account Not Found: {account_not_found}\n"
+                "\n"
+            )
             
             return success, account_not_found
             
@@ -70,26 +85,20 @@ async def test_concurrent_otp_verification():
     
     print("=== Testing Concurrent OTP Verification ===\n")
     
-    # Use the actual phone number from the logs that had issues
-    test_phone = "+19197109288"
-    
-    # Simulate two users trying to verify at the same time
-    # (In reality, these would be different users, but we're testing the lookup logic)
-    test_scenarios = [
-        (test_phone, "123456", "user1"),
-        (test_phone, "654321", "user2")
-    ]
+    test_scenarios = _TEST_SCENARIOS
     
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(headers=JSON_HEADERS) as session:
         print("Sending concurrent OTP verification requests...\n")
         
         # Send both OTP verifications simultaneously
-        tasks = [
-            send_otp_verification(session, phone, otp, user_id)
-            for phone, otp, user_id in test_scenarios
-        ]
+        sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(run_bounded(sem, send_otp_verification(session, phone, otp, user_id), default=(False, False)))
+                for phone, otp, user_id in test_scenarios
+            ]
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = [task.result() for task in tasks]
         
         # Analyze results
         successful_verifications = sum(1 for result in results if isinstance(result, tuple) and result[0])
@@ -105,4 +114,4 @@ async def test_concurrent_otp_verification():
             print("⚠️  Still experiencing account lookup issues")
 
 if __name__ == "__main__":
-    asyncio.run(test_concurrent_otp_verification())
+    run(test_concurrent_otp_verification())
@@ -6,13 +6,26 @@ This simulates multiple users entering their OTP codes simultaneously
 
 import asyncio
 import aiohttp
-import json
-from datetime import datetime
+import sys
 import time
 
+from utils.script_helpers import CONCURRENCY_LIMIT, JSON_HEADERS, dump_json, run_bounded, run
+
+# Successful verification indicators in the webhook response message
+_SUCCESS_KWS = ('welcome', 'verified', 'complete', 'success', 'congratulations')
+
+# Error indicators in the webhook response message
+_ERROR_KWS = ('error', 'invalid', 'expired', 'not found', 'failed')
+
+# Test users created by the earlier signup run: (phone, otp_code, user_id)
+_TEST_USERS = tuple(
+    (f"+1555123456{i}", f"12345{i}", f"otp{i}")
+    for i in range(5)
+)
+
 def create_otp_verification_payload(phone: str, otp_code: str, guid_suffix: str):
     """Create OTP verification payload"""
-    timestamp = int(datetime.now().timestamp() * 1000)
+    timestamp = time.time_ns() // 1_000_000
     
     return {
         "type": "new-message",
@@ -43,32 +56,28 @@ async def verify_otp(session, phone: str, otp_code: str, user_id: str):
         start_time = time.time()
         async with session.post(
             "http://localhost:8000/webhooks/bluebubbles",
-            json=payload,
-            headers={"Content-Type": "application/json"}
+            data=dump_json(payload)
         ) as response:
             result = await response.json()
             end_time = time.time()
             
             success = response.status == 200
             message = result.get('message', '')
+            message_lower = message.lower()
             
-            # Check for successful verification indicators
-            verification_success = any(keyword in message.lower() for keyword in [
-                'welcome', 'verified', 'complete', 'success', 'congratulations'
-            ])
+            verification_success = any(keyword in message_lower for keyword in _SUCCESS_KWS)
+            has_error = any(keyword in message_lower for keyword in _ERROR_KWS)
             
-            # Check for error indicators
-            has_error = any(keyword in message.lower() for keyword in [
-                'error', 'invalid', 'expired', 'not found', 'failed'
-            ])
-            
-            print(f"📱 {phone} (OTP: {otp_code})")
-            print(f"   Status: {response.status}")
-            print(f"   Time: {end_time - start_time:.3f}s")
-            print(f"   Response: {message[:100]}...")
-            print(f"   Verified: {verification_success}")
-            print(f"   Error: {has_error}")
-            print()
+            # Emit the whole report in one write so concurrent tasks don't interleave
+            sys.stdout.write(
+                f"📱 {phone} (OTP: {otp_code})\n"
+                f"   Status: {response.status}\n"
+                f"   Time: {end_time - start_time:.3f}s\n"
+                f"   Response: {message[:100]}...\n"
+                f"   Verified: {verification_success}\n"
+                f"   Error: {has_error}\n"
+                "\n"
+            )
             
             return success and verification_success and not has_error
             
@@ -82,31 +91,35 @@ async def test_concurrent_otp_verification():
     print("=== Testing Concurrent OTP Verification ===\n")
     
     # Use the test users we created earlier
-    test_users = [
-        (f"+1555123456{i}", f"12345{i}", f"otp{i}")
-        for i in range(5)
-    ]
+    test_users = _TEST_USERS
     
     print(f"Testing {len(test_users)} concurrent OTP verifications...\n")
     print("Note: Using dummy OTP codes since we can't access real email OTPs")
     print("This tests the system's ability to handle concurrent verification requests\n")
     
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(headers=JSON_HEADERS) as session:
         # Send all OTP verification requests simultaneously
         start_time = time.time()
-        tasks = [
-            verify_otp(session, phone, otp, user_id)
-            for phone, otp, user_id in test_users
-        ]
+        sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
+        successful_verifications = failed_verifications = errors = 0
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(run_bounded(sem, verify_otp(session, phone, otp, user_id)))
+                for phone, otp, user_id in test_users
+            ]
+            
+            # Tally results as they arrive rather than sweeping the list afterwards
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    if await next_done:
+                        successful_verifications += 1
+                    else:
+                        failed_verifications += 1
+                except Exception:
+                    errors += 1
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
         end_time = time.time()
         
-        # Analyze results
-        successful_verifications = sum(1 for result in results if isinstance(result, bool) and result)
-        failed_verifications = sum(1 for result in results if isinstance(result, bool) and not result)
-        errors = sum(1 for result in results if isinstance(result, Exception))
-        
         print("=== OTP Verification Results ===")
         print(f"Total time: {end_time - start_time:.3f}s")
         print(f"Successful verifications: {successful_verifications}/{len(test_users)}")
@@ -136,14 +149,13 @@ async def test_user_lookup_stress():
             start_time = time.time()
             async with session.post(
                 "http://localhost:8000/webhooks/bluebubbles",
-                json=payload,
-                headers={"Content-Type": "application/json"}
+                data=dump_json(payload)
             ) as response:
                 result = await response.json()
                 end_time = time.time()
                 
-                message = result.get('message', '')
-                user_found = 'not found' not in message.lower()
+                message_lower = result.get('message', '').lower()
+                user_found = 'not found' not in message_lower
                 
                 print(f"Lookup {attempt_id}: {end_time - start_time:.3f}s - User found: {user_found}")
                 return user_found
@@ -152,10 +164,12 @@ async def test_user_lookup_stress():
             print(f"Lookup {attempt_id}: Error - {str(e)}")
             return False
     
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(headers=JSON_HEADERS) as session:
         # Perform 10 concurrent user lookups
-        tasks = [lookup_user(session, i) for i in range(10)]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(run_bounded(sem, lookup_user(session, i))) for i in range(10)]
+        results = [task.result() for task in tasks]
         
         successful_lookups = sum(1 for result in results if isinstance(result, bool) and result)
         
@@ -167,5 +181,5 @@ async def test_user_lookup_stress():
             print("⚠️  User lookup may have issues under concurrent load")
 
 if __name__ == "__main__":
-    asyncio.run(test_concurrent_otp_verification())
-    asyncio.run(test_user_lookup_stress())
+    run(test_concurrent_otp_verification())
+    run(test_user_lookup_stress())
@@ -6,17 +6,27 @@ This will verify the 403 Forbidden fix works under load
 
 import asyncio
 import aiohttp
-import json
-from datetime import datetime
+import time
+
+from utils.script_helpers import CONCURRENCY_LIMIT, JSON_HEADERS, dump_json, run_bounded, run
+
+# Test users with different emails and phone numbers
+_TEST_USERS = (
+    ("user1@test.com", "5551234567", "user1@test.com"),
+    ("user2@test.com", "5551234568", "user2@test.com"),
+    ("user3@test.com", "5551234569", "user3@test.com"),
+    ("user4@test.com", "5551234570", "user4@test.com"),
+    ("user5@test.com", "5551234571", "user5@test.com"),
+)
 
 # Test webhook payload template
 def create_test_payload(email: str, phone: str, message_text: str):
     return {
         "type": "new-message",
         "data": {
-            "guid": f"test-{email.split('@')[0]}-{datetime.now().timestamp()}",
+            "guid": f"test-{email.split('@')[0]}-{time.time()}",
             "text": message_text,
-            "dateCreated": int(datetime.now().timestamp() * 1000),
+            "dateCreated": time.time_ns() // 1_000_000,
             "chatGuid": f"SMS;-;+1{phone}",
             "isFromMe": False,
             "handle": {
@@ -33,8 +43,7 @@ async def send_webhook(session, email: str, phone: str, message_text: str):
     try:
         async with session.post(
             "http://localhost:8000/webhooks/bluebubbles",
-            json=payload,
-            headers={"Content-Type": "application/json"}
+            data=dump_json(payload)
         ) as response:
             result = await response.json()
             status = response.status
@@ -49,30 +58,30 @@ async def send_webhook(session, email: str, phone: str, message_text: str):
 async def test_concurrent_signups():
     """Test multiple users signing up concurrently"""
     
-    # Test users with different emails and phone numbers
-    test_users = [
-        ("user1@test.com", "5551234567", "user1@test.com"),
-        ("user2@test.com", "5551234568", "user2@test.com"), 
-        ("user3@test.com", "5551234569", "user3@test.com"),
-        ("user4@test.com", "5551234570", "user4@test.com"),
-        ("user5@test.com", "5551234571", "user5@test.com")
-    ]
+    test_users = _TEST_USERS
     
     print("=== Testing Concurrent User Signups ===")
     print(f"Testing {len(test_users)} users simultaneously...")
     
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(headers=JSON_HEADERS) as session:
         # Send all requests concurrently
-        tasks = [
-            send_webhook(session, email, phone, message_text)
-            for email, phone, message_text in test_users
-        ]
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Count successes
-        successes = sum(1 for result in results if result is True)
-        failures = len(results) - successes
+        sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
+        successes = failures = 0
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(run_bounded(sem, send_webhook(session, email, phone, message_text)))
+                for email, phone, message_text in test_users
+            ]
+            
+            # Count successes as each request completes
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    if await next_done is True:
+                        successes += 1
+                    else:
+                        failures += 1
+                except Exception:
+                    failures += 1
         
         print(f"\n=== Results ===")
         print(f"✅ Successful: {successes}/{len(test_users)}")
@@ -84,4 +93,4 @@ async def test_concurrent_signups():
             print("⚠️  Some users failed - may need further investigation")
 
 if __name__ == "__main__":
-    asyncio.run(test_concurrent_signups())
+    run(test_concurrent_signups())
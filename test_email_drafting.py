@@ -4,14 +4,32 @@ Test script for email drafting functionality end-to-end
 Tests the complete flow from AI response parsing to Google integration
 """
 
-import asyncio
-import json
-import re
+import contextlib
+import functools
 import os
+from dataclasses import dataclass
 from unittest.mock import AsyncMock, MagicMock, patch
 from services.ai_conversation_service import AIConversationService
+from utils.script_helpers import run
 from services.google_integration_service import GoogleIntegrationService
 
+@dataclass(slots=True)
+class _Resp:
+    """Minimal stand-in for a Supabase execute() response"""
+    data: object
+
+@contextlib.contextmanager
+def mock_httpx(status_code=200, body=None, text=None):
+    """Patch httpx.AsyncClient so every post() returns one canned response"""
+    with patch('httpx.AsyncClient') as mock_client:
+        mock_response = MagicMock()
+        mock_response.status_code = status_code
+        mock_response.json.return_value = body or {}
+        if text is not None:
+            mock_response.text = text
+        mock_client.return_value.__aenter__.return_value.post = AsyncMock(return_value=mock_response)
+        yield mock_client
+
 # Mock Supabase client
 class MockSupabaseClient:
     def __init__(self):
@@ -31,37 +49,42 @@ class MockSupabaseClient:
                 }
             ]
         }
+        # Fixtures are static, so query results are memoized by (table, filters)
+        self._query_cache = {}
     
     def table(self, table_name):
-        return MockTable(self.table_data.get(table_name, []))
+        return MockTable(self.table_data.get(table_name, []), table_name, self._query_cache)
 
 class MockTable:
-    def __init__(self, data):
+    def __init__(self, data, table_name=None, query_cache=None):
         self.data = data
-        self._filters = {}
+        self._table_name = table_name
+        self._query_cache = {} if query_cache is None else query_cache
+        self._filters = ()
     
     def select(self, columns):
         return self
     
     def eq(self, column, value):
-        self._filters[column] = value
+        self._filters += ((column, value),)
         return self
     
     def single(self):
         return self
     
     def execute(self):
-        # Filter data based on applied filters
-        filtered_data = self.data
-        for item in filtered_data:
-            match = True
-            for key, value in self._filters.items():
-                if item.get(key) != value:
-                    match = False
-                    break
-            if match:
-                return MagicMock(data=item)
-        return MagicMock(data=None)
+        key = (self._table_name, frozenset(self._filters))
+        response = self._query_cache.get(key)
+        if response is None:
+            response = self._query_cache[key] = _Resp(data=self._find_match())
+        return response
+    
+    def _find_match(self):
+        # Return the first row matching every applied filter
+        for item in self.data:
+            if all(item.get(key) == value for key, value in self._filters):
+                return item
+        return None
     
     def update(self, data):
         return self
@@ -69,6 +92,21 @@ class MockTable:
     def insert(self, data):
         return self
 
+def strip_json_block(text: str) -> str:
+    """Remove the first fenced ```json block from an AI response by slicing around its fences"""
+    before, fence, rest = text.partition("```json")
+    if not fence:
+        return text.strip()
+    _, close, after = rest.partition("```")
+    if not close:
+        return text.strip()
+    return (before + after).strip()
+
+@functools.lru_cache(maxsize=1)
+def _service() -> AIConversationService:
+    """Shared AI service; the mock fixtures are static so tests can reuse one instance"""
+    return AIConversationService(MockSupabaseClient())
+
 async def test_function_parsing():
     """Test that AI responses with JSON function calls are properly parsed"""
     print("🧪 Testing function call parsing...")
@@ -90,8 +128,7 @@ async def test_function_parsing():
 let me know if you want to make any changes"""
 
     # Create AI service with mock Supabase
-    mock_supabase = MockSupabaseClient()
-    ai_service = AIConversationService(mock_supabase)
+    ai_service = _service()
     
     # Test function parsing
     function_result = await ai_service._parse_and_execute_function(
@@ -103,8 +140,7 @@ let me know if you want to make any changes"""
         print(f"   Result: {function_result}")
         
         # Test JSON block removal
-        cleaned_response = re.sub(r"```json\s*\{.*?\}\s*```", "", ai_response, flags=re.DOTALL)
-        cleaned_response = cleaned_response.strip()
+        cleaned_response = strip_json_block(ai_response)
         print(f"✅ JSON block removed, remaining text: '{cleaned_response}'")
         
         return True
@@ -119,18 +155,8 @@ async def test_google_integration_mock():
     mock_supabase = MockSupabaseClient()
     google_service = GoogleIntegrationService(mock_supabase, '+1234567890')
     
-    # Mock the HTTP client response
-    with patch('httpx.AsyncClient') as mock_client:
-        # Mock successful draft creation
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            'id': 'draft-123',
-            'message': {'id': 'msg-456'}
-        }
-        
-        mock_client.return_value.__aenter__.return_value.post = AsyncMock(return_value=mock_response)
-        
+    # Mock successful draft creation
+    with mock_httpx(200, {'id': 'draft-123', 'message': {'id': 'msg-456'}}):
         # Test draft email
         result = await google_service.draft_email(
             to=['test@example.com'],
@@ -166,16 +192,10 @@ async def test_complete_flow():
 
 the draft is ready for you to review"""
 
-    mock_supabase = MockSupabaseClient()
-    ai_service = AIConversationService(mock_supabase)
+    ai_service = _service()
     
     # Mock the Google integration HTTP calls
-    with patch('httpx.AsyncClient') as mock_client:
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {'id': 'draft-789'}
-        mock_client.return_value.__aenter__.return_value.post = AsyncMock(return_value=mock_response)
-        
+    with mock_httpx(200, {'id': 'draft-789'}):
         # Test function parsing and execution
         function_result = await ai_service._parse_and_execute_function(
             test_ai_response, 'test-user-123', '+1234567890'
@@ -185,8 +205,7 @@ the draft is ready for you to review"""
             print("✅ Complete flow working correctly")
             
             # Test response cleaning
-            cleaned_response = re.sub(r"```json\s*\{.*?\}\s*```", "", test_ai_response, flags=re.DOTALL)
-            cleaned_response = cleaned_response.strip()
+            cleaned_response = strip_json_block(test_ai_response)
             
             if cleaned_response:
                 final_response = [cleaned_response, function_result]
@@ -218,16 +237,10 @@ async def test_error_handling():
 
 should be ready soon"""
 
-    mock_supabase = MockSupabaseClient()
-    ai_service = AIConversationService(mock_supabase)
+    ai_service = _service()
     
     # Mock failed HTTP response
-    with patch('httpx.AsyncClient') as mock_client:
-        mock_response = MagicMock()
-        mock_response.status_code = 400
-        mock_response.text = "Invalid email address"
-        mock_client.return_value.__aenter__.return_value.post = AsyncMock(return_value=mock_response)
-        
+    with mock_httpx(400, text="Invalid email address"):
         function_result = await ai_service._parse_and_execute_function(
             test_ai_response, 'test-user-123', '+1234567890'
         )
@@ -240,6 +253,14 @@ should be ready soon"""
             print(f"❌ Error handling failed: {function_result}")
             return False
 
+async def run_safely(test_name, test_func):
+    """Run a single test, reporting exceptions as a failure"""
+    try:
+        return await test_func()
+    except Exception as e:
+        print(f"❌ {test_name} failed with exception: {str(e)}")
+        return False
+
 async def main():
     """Run all tests"""
     print("🚀 Starting Email Drafting End-to-End Tests\n")
@@ -251,14 +272,11 @@ async def main():
         ("Error Handling", test_error_handling)
     ]
     
+    # Run one at a time: patch('httpx.AsyncClient') is process-wide, so overlapping
+    # tests would see each other's mocks
     results = []
     for test_name, test_func in tests:
-        try:
-            result = await test_func()
-            results.append((test_name, result))
-        except Exception as e:
-            print(f"❌ {test_name} failed with exception: {str(e)}")
-            results.append((test_name, False))
+        results.append((test_name, await run_safely(test_name, test_func)))
     
     print("\n📊 Test Results Summary:")
     print("=" * 50)
@@ -278,4 +296,4 @@ async def main():
         print("⚠️  Some tests failed. Check the output above for details.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
@@ -5,15 +5,109 @@ Test the fixed function parsing with proper JSON handling
 
 import asyncio
 import json
-import re
+import operator
 import sys
 import os
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+# Prefer orjson's decoder when installed; it accepts str directly
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
 
 # Add the current directory to Python path
-sys.path.append('/Users/Rk/Documents/GitHub/prod-backend')
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
 
-from unittest.mock import AsyncMock, MagicMock, patch
+import httpx
+from unittest.mock import patch
 from services.ai_conversation_service import AIConversationService
+from utils.script_helpers import run
+
+@dataclass(slots=True, frozen=True)
+class _Resp:
+    """Minimal stand-in for a Supabase execute() response"""
+    data: Any
+
+def _draft_handler(request: httpx.Request) -> httpx.Response:
+    """Answer every outbound Google API call with a canned Gmail draft"""
+    return httpx.Response(200, json={'id': 'draft-123', 'message': {'id': 'msg-456'}})
+
+_DRAFT_TRANSPORT = httpx.MockTransport(_draft_handler)
+_RealAsyncClient = httpx.AsyncClient
+
+def _mock_async_client(*args, **kwargs):
+    """Build a real httpx.AsyncClient that never leaves the process"""
+    kwargs['transport'] = _DRAFT_TRANSPORT
+    return _RealAsyncClient(*args, **kwargs)
+
+_JSON_FENCE_OPEN = "```json"
+_JSON_FENCE_CLOSE = "```"
+
+def find_json_block(text: str) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Locate the first fenced ```json block in an AI response with a single scan
+    
+    Args:
+        text: AI response text
+        
+    Returns:
+        (fence_start, fence_end, object_start, object_end) offsets, or None
+        if there is no complete fenced JSON object
+    """
+    fence_start = text.find(_JSON_FENCE_OPEN)
+    if fence_start == -1:
+        return None
+    
+    object_start = text.find("{", fence_start)
+    if object_start == -1 or text[fence_start + len(_JSON_FENCE_OPEN):object_start].strip():
+        return None
+    
+    # Track brace depth, ignoring braces inside string literals and escapes
+    depth = 0
+    in_string = False
+    escaped = False
+    for k in range(object_start, len(text)):
+        c = text[k]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                object_end = k + 1
+                fence_close = text.find(_JSON_FENCE_CLOSE, object_end)
+                if fence_close == -1 or text[object_end:fence_close].strip():
+                    return None
+                return fence_start, fence_close + len(_JSON_FENCE_CLOSE), object_start, object_end
+    
+    return None
+
+def extract_json_block(text: str) -> Optional[str]:
+    """Return the JSON object inside the first ```json fence, or None"""
+    span = find_json_block(text)
+    if span is None:
+        return None
+    return text[span[2]:span[3]]
+
+def _build_column_index(rows):
+    """Index rows as {column: {value: [row, ...]}} for constant-time eq() lookups"""
+    index = {}
+    for row in rows:
+        for column, value in row.items():
+            index.setdefault(column, {}).setdefault(value, []).append(row)
+    return index
 
 class MockSupabaseClient:
     def __init__(self):
@@ -21,27 +115,52 @@ class MockSupabaseClient:
             'user_profiles': [{'id': 'test-user-123', 'phone_number': '+1234567890', 'conversation_history': ''}],
             'google_accounts': [{'id': 'google-account-123', 'user_id': 'test-user-123', 'email': 'test@example.com'}]
         }
+        self._indexes = {name: _build_column_index(rows) for name, rows in self.table_data.items()}
     
     def table(self, table_name):
-        return MockTable(self.table_data.get(table_name, []))
+        return MockTable(self.table_data.get(table_name, []), self._indexes.get(table_name, {}))
 
 class MockTable:
-    def __init__(self, data):
+    def __init__(self, data, index=None):
         self.data = data
-        self._filters = {}
+        self._index = index if index is not None else _build_column_index(data)
+        self._keys = ()
+        self._vals = ()
+        self._single = False
     
     def select(self, columns): return self
-    def eq(self, column, value): self._filters[column] = value; return self
-    def single(self): return self
+    def eq(self, column, value):
+        self._keys = (*self._keys, column)
+        self._vals = (*self._vals, value)
+        return self
+    def single(self): self._single = True; return self
     def update(self, data): return self
     def insert(self, data): return self
     
     def execute(self):
-        for item in self.data:
-            match = all(item.get(k) == v for k, v in self._filters.items())
-            if match:
-                return MagicMock(data=item)
-        return MagicMock(data=None)
+        if not self._keys:
+            if self._single:
+                return _Resp(data=self.data[0] if self.data else None)
+            return _Resp(data=self.data)
+        
+        # itemgetter returns a bare value for one key and a tuple for several
+        getter = operator.itemgetter(*self._keys)
+        expected = self._vals[0] if len(self._vals) == 1 else self._vals
+        
+        # Start from the narrowest per-column bucket and check the other filters on it;
+        # single() stops at the first match, otherwise every match is returned like Supabase
+        buckets = [self._index.get(k, {}).get(v, ()) for k, v in zip(self._keys, self._vals)]
+        matches = []
+        for item in min(buckets, key=len):
+            try:
+                if getter(item) != expected:
+                    continue
+            except KeyError:
+                continue
+            if self._single:
+                return _Resp(data=item)
+            matches.append(item)
+        return _Resp(data=None if self._single else matches)
 
 def test_json_parsing_fix():
     """Test the improved JSON parsing with various edge cases"""
@@ -98,26 +217,25 @@ def test_json_parsing_fix():
         print(f"\n  Testing: {test_case['name']}")
         
         # Extract JSON manually to test parsing
-        json_match = re.search(r"```json\s*(\{.*?\})\s*```", test_case['response'], re.DOTALL)
-        if not json_match:
+        json_str = extract_json_block(test_case['response'])
+        if json_str is None:
             print(f"    ❌ No JSON match found")
             results.append(False)
             continue
-            
-        json_str = json_match.group(1).strip()
         
         # Try the same parsing logic as the fixed function
         try:
-            function_call = json.loads(json_str)
+            function_call = _json_loads(json_str)
             print(f"    ✅ Direct JSON parsing worked")
             results.append(True)
-        except json.JSONDecodeError as e:
+        except ValueError as e:
+            # json.JSONDecodeError and orjson.JSONDecodeError both subclass ValueError
             print(f"    ⚠️  Direct parsing failed: {e}")
             try:
-                # Try the fallback method
-                json_str_cleaned = json_str.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
-                function_call = json.loads(json_str_cleaned)
-                print(f"    ✅ Cleaned JSON parsing worked")
+                # Fall back to the stdlib decoder, which tolerates raw control
+                # characters inside strings when strict=False
+                function_call = json.loads(json_str, strict=False)
+                print(f"    ✅ Lenient JSON parsing worked")
                 results.append(True)
             except Exception as e2:
                 print(f"    ❌ All parsing methods failed: {e2}")
@@ -151,11 +269,7 @@ the draft should be ready for review'''
     ai_service = AIConversationService(mock_supabase)
     
     # Mock the HTTP client for Google integration
-    with patch('httpx.AsyncClient') as mock_client:
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {'id': 'draft-123', 'message': {'id': 'msg-456'}}
-        mock_client.return_value.__aenter__.return_value.post = AsyncMock(return_value=mock_response)
+    with patch('httpx.AsyncClient', _mock_async_client):
         
         # Test the function parsing and execution
         function_result = await ai_service._parse_and_execute_function(
@@ -167,7 +281,8 @@ the draft should be ready for review'''
             print(f"    Result: {function_result}")
             
             # Test the response cleaning
-            cleaned_response = re.sub(r"```json\s*\{.*?\}\s*```", "", ai_response, flags=re.DOTALL)
+            span = find_json_block(ai_response)
+            cleaned_response = ai_response[:span[0]] + ai_response[span[1]:] if span else ai_response
             cleaned_response = cleaned_response.strip()
             
             if cleaned_response:
@@ -221,4 +336,4 @@ async def main():
         print("⚠️  Some tests failed.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
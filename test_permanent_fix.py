@@ -7,10 +7,54 @@ This verifies that user creation now works with trigger-created profiles
 import asyncio
 import os
 from dotenv import load_dotenv
-from supabase import create_client
 from services.auth_user_service import AuthUserService
+from utils.dependencies import create_pooled_client
+from utils.script_helpers import CONCURRENCY_LIMIT, in_thread, run, size_thread_pool
 import time
 
+async def create_and_verify(auth_service: AuthUserService, sem: asyncio.Semaphore, i: int, email: str, phone: str, guid: str) -> bool:
+    """Create one user, report the outcome, and clean up"""
+    # Collect the report and print it once so concurrent users don't interleave
+    lines = [f"--- Testing User {i+1}: {email} ---"]
+    success = False
+    
+    try:
+        # Test the fixed user creation logic; the blocking client runs in a
+        # worker thread so the creations really overlap
+        async with sem:
+            user_with_profile = await in_thread(auth_service.create_authenticated_user(
+                bluebubbles_guid=guid,
+                phone_number=phone,
+                email=email,
+                chat_identifier=phone
+            ))
+        
+        if user_with_profile:
+            lines.append(f"✅ User created successfully: {user_with_profile.auth_user.id}")
+            lines.append(f"   Email: {user_with_profile.auth_user.email}")
+            lines.append(f"   Phone: {user_with_profile.profile.phone_number}")
+            lines.append(f"   GUID: {user_with_profile.profile.bluebubbles_guid}")
+            
+            success = True
+            
+            # Clean up
+            await asyncio.to_thread(auth_service.admin_auth.delete_user, user_with_profile.auth_user.id)
+            lines.append(f"✅ Test user cleaned up")
+        else:
+            lines.append(f"❌ User creation failed - no user returned")
+            
+    except Exception as e:
+        error_msg = str(e)
+        lines.append(f"❌ User creation failed: {error_msg}")
+        
+        if "User not allowed" in error_msg or "403" in error_msg:
+            lines.append("   This indicates the fix didn't work - still getting 403 errors")
+        else:
+            lines.append(f"   Unexpected error: {error_msg}")
+    
+    print("\n".join(lines) + "\n")
+    return success
+
 async def test_permanent_fix():
     """Test the permanent fix for concurrent user creation"""
     
@@ -31,50 +75,20 @@ async def test_permanent_fix():
         for i in range(5)
     ]
     
-    success_count = 0
+    # One service-role client serves every task; it holds no per-user session state
+    client = create_pooled_client(url, key)
+    auth_service = AuthUserService(client)
     
-    for i, (email, phone, guid) in enumerate(test_users):
-        print(f"--- Testing User {i+1}: {email} ---")
-        
-        try:
-            # Create fresh client for each test
-            client = create_client(url, key)
-            auth_service = AuthUserService(client)
-            
-            # Test the fixed user creation logic
-            user_with_profile = await auth_service.create_authenticated_user(
-                bluebubbles_guid=guid,
-                phone_number=phone,
-                email=email,
-                chat_identifier=phone
-            )
-            
-            if user_with_profile:
-                print(f"✅ User created successfully: {user_with_profile.auth_user.id}")
-                print(f"   Email: {user_with_profile.auth_user.email}")
-                print(f"   Phone: {user_with_profile.profile.phone_number}")
-                print(f"   GUID: {user_with_profile.profile.bluebubbles_guid}")
-                
-                success_count += 1
-                
-                # Clean up
-                client.auth.admin.delete_user(user_with_profile.auth_user.id)
-                print(f"✅ Test user cleaned up")
-            else:
-                print(f"❌ User creation failed - no user returned")
-                
-        except Exception as e:
-            error_msg = str(e)
-            print(f"❌ User creation failed: {error_msg}")
-            
-            if "User not allowed" in error_msg or "403" in error_msg:
-                print("   This indicates the fix didn't work - still getting 403 errors")
-            elif "duplicate" in error_msg.lower() or "already exists" in error_msg.lower():
-                print("   This indicates trigger conflict still exists")
-            else:
-                print(f"   Unexpected error: {error_msg}")
-        
-        print()
+    # Run every creation at once so the trigger-conflict race is actually exercised;
+    # the semaphore bounds the worker threads, so the pool must not be the smaller cap
+    size_thread_pool(CONCURRENCY_LIMIT)
+    sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
+    tasks = [
+        create_and_verify(auth_service, sem, i, email, phone, guid)
+        for i, (email, phone, guid) in enumerate(test_users)
+    ]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    success_count = sum(1 for r in results if r is True)
     
     print("=== Test Results ===")
     print(f"Successful creations: {success_count}/{len(test_users)}")
@@ -90,4 +104,4 @@ async def test_permanent_fix():
         return False
 
 if __name__ == "__main__":
-    asyncio.run(test_permanent_fix())
+    run(test_permanent_fix())
